@@ -5,103 +5,216 @@ import re
 import json
 import logging
 import sys
-from sqlalchemy import URL
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from sqlalchemy import text
 from llama_index.vector_stores.tidbvector import TiDBVectorStore
 from llama_index.core.retrievers import VectorIndexRetriever
 from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.core import (
+    QueryBundle,
     VectorStoreIndex,
-    StorageContext,
     get_response_synthesizer
 )
 from llama_index.core.vector_stores.types import MetadataFilter, MetadataFilters, FilterCondition
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.llms.openai import OpenAI
-
-# Load environment variables
-load_dotenv()
+from tidb_engine import ENGINE_ARGS, get_engine, tidb_connection_url
 
 # Configure logging
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Define constants
-EMBEDDING_MODEL = OpenAIEmbedding(model="text-embedding-ada-002")
 EMBEDDING_DIMENSION = 1536
-SECTION_PATTERN = r'\\section\{(.+?)\}(.*?)(?=\\subsection|\Z)'
-SUBSECTION_PATTERN = r'\\subsection\{(.+?)\}(.*?)(?=\\subsection|\Z)'
+SECTION_PATTERN = re.compile(r'\\section\{(.+?)\}(.*?)(?=\\subsection|\Z)', re.DOTALL)
+SUBSECTION_PATTERN = re.compile(r'\\subsection\{(.+?)\}(.*?)(?=\\subsection|\Z)', re.DOTALL)
+LATEX_BLOCK_PATTERN = re.compile(r'``` ?latex(.*?)```', re.DOTALL)
+SUBSECTION_CHAT_INIT = '\nNow for the following LaTeX ======================= \n ```latex\n'
 
 def extract_latex_content(response):
     """
     Extracts LaTeX content from the response if available.
     Otherwise, returns the full response.
     """
-    latex_match = re.search(r'``` ?latex(.*?)```', response.response, re.DOTALL)
-    return latex_match.group(1) if latex_match else response.response
+    response_text = response.response
+    # Skip the regex entirely when there is no code fence to unwrap
+    if '```' not in response_text:
+        return response_text
+    latex_match = LATEX_BLOCK_PATTERN.search(response_text)
+    return latex_match.group(1) if latex_match else response_text
+
+@lru_cache(maxsize=1)
+def get_embedding_model():
+    """Helper: Build the embedding client on first use and reuse it afterwards."""
+    # Batch up to 100 inputs per request (the client default is 10), matching ingestion
+    return OpenAIEmbedding(model="text-embedding-ada-002", embed_batch_size=100)
+
+@lru_cache(maxsize=4)
+def get_index(vector_table_name):
+    """Helper: Connect to a vector table and build its index once per process."""
+    vector_store = TiDBVectorStore(
+        connection_string=tidb_connection_url(),
+        table_name=vector_table_name,
+        distance_strategy="cosine",
+        vector_dimension=EMBEDDING_DIMENSION,
+        engine_args=ENGINE_ARGS,
+        drop_existing_table=False,
+    )
 
+    return VectorStoreIndex.from_vector_store(
+        vector_store=vector_store,
+        embed_model=get_embedding_model(),
+    )
+
+@lru_cache(maxsize=4)
+def get_llm(model):
+    """Helper: Build one OpenAI LLM client per model and share it across calls."""
+    return OpenAI(model=model)
+
+@lru_cache(maxsize=None)
 def load_prompt(file_name):
-    """Helper: Load a prompt from a file."""
+    """Helper: Load a prompt from a file, reading each file once per process."""
     with open(os.path.join("prompts", file_name), "r", encoding="utf-8") as f:
         return f.read().strip()
 
-def main(args=None):
-    # Parse command-line arguments
-    parser = argparse.ArgumentParser(description="Generate enhanced LaTeX content.")
-    parser.add_argument("--module_name", help="Name of the module to process.")
-    parser.add_argument("--vector_table_name", default="demo_load_docs_to_llamaindex", help="Vector table name.")
-    cli_args = parser.parse_args(args)
-
-    # Override environment variables with CLI arguments if provided
-    module_name = cli_args.module_name or os.getenv("MODULE_NAME")
-    vector_table_name = cli_args.vector_table_name
+def fetch_module_item_slugs(engine, table_name, module_name):
+    """
+    List the distinct item slugs stored for a module, read straight from the vector
+    table's JSON metadata column (no embedding call or similarity search needed).
+    """
+    # The table name comes from the CLI, so let the dialect quote and escape it
+    quoted_table = engine.dialect.identifier_preparer.quote(table_name)
+    query = text(
+        "SELECT DISTINCT JSON_UNQUOTE(JSON_EXTRACT(meta, '$.item_slug')) AS item_slug "
+        f"FROM {quoted_table} "
+        "WHERE JSON_UNQUOTE(JSON_EXTRACT(meta, '$.module_name')) = :module_name "
+        "ORDER BY item_slug"
+    )
+    with engine.connect() as conn:
+        rows = conn.execute(query, {"module_name": module_name})
+        return [row.item_slug for row in rows if row.item_slug]
 
-    if not module_name:
-        logger.error("Module name and database name must be specified via CLI or environment variables.")
-        sys.exit(1)
+def tex_out_path(module_dir, title, order, used_paths):
+    """
+    Helper: Return a .tex path for a section that no other section in `used_paths` writes to.
+    Repeated titles get their order appended, so concurrent workers never share a file.
+    """
+    out_path = f"{module_dir}/{title}.tex"
+    if out_path in used_paths:
+        out_path = f"{module_dir}/{title} ({order}).tex"
+    used_paths.add(out_path)
+    return out_path
 
-    # Load prompts
-    query = load_prompt("assistant_message.txt")
-    intro_query = load_prompt("intro_query.txt")
-    sub_query = load_prompt("subsection_query.txt")
+def process_section(index, metadata_filters, intro_query, section_out_path, section_title, section_content):
+    """
+    Summarise the main section with the intro prompt and save it to `section_out_path`.
+    Returns the metadata entry for the section.
+    """
+    print(f"Processing section: {section_title}")
 
-    # Step 1: Load the index from storage
-    tidb_connection_url = URL(
-        "mysql+pymysql",
-        username=os.getenv("TIDB_USERNAME"),
-        password=os.getenv("TIDB_PASSWORD"),
-        host=os.getenv("TIDB_HOST"),
-        port=int(os.getenv("TIDB_PORT", 4000)),
-        database=os.getenv("TIDB_DB_NAME"),
-        query={"ssl_verify_cert": True, "ssl_verify_identity": True},
+    retriever = VectorIndexRetriever(
+        index=index,
+        similarity_top_k=20,
+        embedding_model=get_embedding_model(),
+        filters=metadata_filters,
     )
 
-    vector_store = TiDBVectorStore(
-        connection_string=tidb_connection_url,
-        table_name=vector_table_name,
-        distance_strategy="cosine",
-        vector_dimension=EMBEDDING_DIMENSION,
-        drop_existing_table=False,
+    llm = get_llm("gpt-4o-mini")
+    response_synthesizer = get_response_synthesizer(llm=llm)
+
+    query_engine = RetrieverQueryEngine(
+        retriever=retriever,
+        response_synthesizer=response_synthesizer,
     )
 
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
+    response = query_engine.query(intro_query + "The title and content to summarize are as follows:\n```latex\n\section{ " + section_title + "}\n" + section_content)
 
-    index = VectorStoreIndex.from_vector_store(
-        vector_store=vector_store,
-        embed_model=EMBEDDING_MODEL,
+    # Print and save the response
+    print(response)
+
+    tex_content_intro = extract_latex_content(response)
+
+    # Save the assistant message to a file
+    with open(section_out_path, "w", encoding="utf-8") as file:
+        file.write(tex_content_intro)
+
+    return {
+        "order": 0,
+        "type": "section",
+        "title": section_title,
+        "path": section_out_path
+    }
+
+def process_subsection(index, metadata_filters, sub_prompt_prefix, subsection_out_path, order, title, content, query_embedding):
+    """
+    Enhance a subsection using its best matching documents and save it to `subsection_out_path`.
+    `sub_prompt_prefix` is the static part of the prompt shared by every subsection and
+    `query_embedding` is the precomputed embedding of the subsection's retrieval query.
+    Returns the metadata entry for the subsection.
+    """
+    print(f"Processing subsection: {title}")
+    subsection_latex_formatted = f"\subsection{{{title}}}\n{content}"
+
+    # Set up the query engine with the filters
+    retriever = VectorIndexRetriever(
+        index=index,
+        similarity_top_k=10,
+        embedding_model=get_embedding_model(),
+        filters=metadata_filters,
+    )
+
+    source_nodes = retriever.retrieve(QueryBundle(query_str=title + ': ' + content, embedding=query_embedding))
+    item_names = {x.metadata['item_name'] for x in source_nodes}
+    print(f"Top Document Results for {title}: {item_names}")
+    llm = get_llm("gpt-4o-mini")
+    item_filters = MetadataFilters(
+        filters=[MetadataFilter(key="item_name", value=item_name, operator="==") for item_name in item_names],
+        condition=FilterCondition.OR,
     )
 
+    query_engine = index.as_query_engine(filters=item_filters, llm=llm)
+
+    response = query_engine.query(sub_prompt_prefix + subsection_latex_formatted)
+    tex_content_subsection = extract_latex_content(response)
+
+    # Save the enhanced content to the corresponding .tex file
+    with open(subsection_out_path, 'w', encoding='utf-8') as file:
+        file.write(f"{tex_content_subsection}")
+
+    return {
+        "order": order,
+        "type": "subsection",
+        "title": title,
+        "path": subsection_out_path
+    }
+
+def execute(module_name, vector_table_name="demo_load_docs_to_llamaindex"):
+    """
+    Query LlamaIndex for a module and save the enhanced LaTeX sections and metadata.
+    """
+    # Load prompts
+    query = load_prompt("assistant_message.txt")
+    intro_query = load_prompt("intro_query.txt")
+    sub_query = load_prompt("subsection_query.txt")
+    sub_prompt_prefix = sub_query + SUBSECTION_CHAT_INIT
+
+    embedding_model = get_embedding_model()
+
+    # Step 1: Load the index from storage
+    index = get_index(vector_table_name)
+
     # Define filters for the query
-    filters = [{"key": "module_name", "value": module_name, "operator": "=="}]
-    metadata_filters = MetadataFilters(filters=[MetadataFilter(**f) for f in filters])
+    metadata_filters = MetadataFilters(filters=[MetadataFilter(key="module_name", value=module_name, operator="==")])
 
     retriever = VectorIndexRetriever(
         index=index,
         similarity_top_k=20,
-        embedding_model=EMBEDDING_MODEL,
+        embedding_model=embedding_model,
         filters=metadata_filters,
     )
 
-    llm = OpenAI(model="gpt-4o")
+    llm = get_llm("gpt-4o")
     response_synthesizer = get_response_synthesizer(llm=llm)
 
     query_engine = RetrieverQueryEngine(
@@ -109,14 +222,12 @@ def main(args=None):
         response_synthesizer=response_synthesizer,
     )
 
-    source_nodes = retriever.retrieve("List all the files")
-    unique_topics = set([x.metadata['item_slug'] for x in source_nodes])
+    unique_topics = fetch_module_item_slugs(get_engine(), vector_table_name, module_name)
     unique_topics_str = ', '.join(unique_topics)
 
     # Query and process results
     response = query_engine.query(query + f"\n\n =============== \n Your answer should contain at least one subsection per topic as per the retrieved documents: {unique_topics_str}.")
     print(response)
-    unique_topics = set([x['item_slug'] for x in response.metadata.values()])
 
     # Extract course and module information
     course_names = [x['course_name'] for x in response.metadata.values()]
@@ -127,122 +238,81 @@ def main(args=None):
     course_name = course_names[0]
     module_name = module_names[0]
 
-    # Create output directories
-    out_path = f"assistant_latex/{course_name}/{module_name}/assistant_message.tex"
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    # Create the output directory once; every file below is written into it
+    module_dir = f"assistant_latex/{course_name}/{module_name}"
+    os.makedirs(module_dir, exist_ok=True)
+
+    out_path = f"{module_dir}/assistant_message.tex"
 
     # Save assistant message
     with open(out_path, "w") as file:
         file.write(response.response)
 
     tex_content = extract_latex_content(response)
-    section_match = re.search(SECTION_PATTERN, tex_content, re.DOTALL)
-    subsections = re.findall(SUBSECTION_PATTERN, tex_content, re.DOTALL)
-
-    # Initialize metadata
-    metadata = {"sections": []}
-
-    # Process the main section first
-    if section_match:
-        section_title, section_content = section_match.groups()
-        print(f"Processing section: {section_title}")
-
-        retriever = VectorIndexRetriever(
-            index=index,
-            similarity_top_k=20,
-            embedding_model=EMBEDDING_MODEL,
-            filters=metadata_filters,
-        )
-
-        llm = OpenAI(model="gpt-4o-mini")
-        response_synthesizer = get_response_synthesizer(llm=llm)
-
-        query_engine = RetrieverQueryEngine(
-            retriever=retriever,
-            response_synthesizer=response_synthesizer,
-        )
-
-        response = query_engine.query(intro_query + "The title and content to summarize are as follows:\n```latex\n\section{ " + section_title + "}\n" + section_content)
-
-        # Step 5: Print and save the response
-        print(response)
-
-        tex_content_intro = extract_latex_content(response)
-
-        # Create the directory if it doesn't exist
-        section_out_path = f"assistant_latex/{course_name}/{module_name}/{section_title}.tex"
-        os.makedirs(os.path.dirname(section_out_path), exist_ok=True)
-
-        # Save the assistant message to a file
-        with open(section_out_path, "w") as file:
-            file.write(tex_content_intro)
-
-        # Add section info to metadata
-        metadata["sections"].append({
-            "order": 0,
-            "type": "section",
-            "title": section_title,
-            "path": section_out_path
-        })
-
-    # Process each subsection and save it to its respective file
-    for i, (title, content) in enumerate(subsections, start=1):
-        print(f"Processing subsection: {title}")
-        subsection_latex_formatted = f"\subsection{{{title}}}\n{content}"
-
-        # Step 3: Set up the query engine with the filters
-
-        retriever = VectorIndexRetriever(
-                    index=index,
-                    similarity_top_k=10,
-                    embedding_model=EMBEDDING_MODEL,
-                    filters=metadata_filters,
-                )
-
-        source_nodes = retriever.retrieve(title + ': ' + content)
-        item_names = set([x.metadata['item_name'] for x in source_nodes])
-        print(f"Top Document Results for {title}: {item_names}")
-        item_ids = [x.node_id for x in source_nodes]
-        filters = [
-            {
-                "key": "item_name",
-                "value": item_id,
-                "operator": "==",
-            } for item_id in item_names
-        ]
-
-        llm = OpenAI(model="gpt-4o-mini")
-        metadata_filters = MetadataFilters(filters=[MetadataFilter(**f) for f in filters], condition=FilterCondition.OR)
-
-        query_engine = index.as_query_engine(filters=metadata_filters, llm=llm)
-        chat_init = '\nNow for the following LaTeX ======================= \n ```latex\n'
-
-        response = query_engine.query(sub_query + chat_init + subsection_latex_formatted)
-        tex_content_subsection = extract_latex_content(response)
-
-        # Define the output path for each subsection
-        subsection_out_path = f"assistant_latex/{course_name}/{module_name}/{title}.tex"
-
-        # Save the enhanced content to the corresponding .tex file
-        with open(subsection_out_path, 'w') as file:
-            file.write(f"{tex_content_subsection}")
-
-        # Add subsection info to metadata
-        metadata["sections"].append({
-            "order": i,
-            "type": "subsection",
-            "title": title,
-            "path": subsection_out_path
-        })
+    section_match = SECTION_PATTERN.search(tex_content)
+    subsections = SUBSECTION_PATTERN.findall(tex_content)
+
+    # Embed every subsection's retrieval query in one batched request
+    subsection_embeddings = embedding_model.get_text_embedding_batch(
+        [title + ': ' + content for title, content in subsections]
+    )
+
+    # Give every section its own output file; assistant_message.tex is already taken
+    used_paths = {out_path}
+
+    # Process the main section and every subsection concurrently. Each one is an
+    # independent retrieval + LLM round-trip; futures are collected in document order.
+    max_workers = int(os.getenv("LLM_CONCURRENCY", 6))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        if section_match:
+            section_title, section_content = section_match.groups()
+            futures.append(executor.submit(
+                process_section, index, metadata_filters, intro_query,
+                tex_out_path(module_dir, section_title, 0, used_paths), section_title, section_content
+            ))
+        for i, ((title, content), query_embedding) in enumerate(zip(subsections, subsection_embeddings), start=1):
+            futures.append(executor.submit(
+                process_subsection, index, metadata_filters, sub_prompt_prefix,
+                tex_out_path(module_dir, title, i, used_paths), i, title, content, query_embedding
+            ))
+
+        try:
+            metadata = {"sections": [future.result() for future in futures]}
+        except BaseException:
+            # Drop the queued LLM calls so the first failure surfaces without spending more requests
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
 
     # Save metadata to a JSON file
-    metadata_path = f"assistant_latex/{course_name}/{module_name}/metadata.json"
+    metadata_path = f"{module_dir}/metadata.json"
     with open(metadata_path, 'w') as metadata_file:
-        json.dump(metadata, metadata_file, indent=4)
+        metadata_file.write(json.dumps(metadata, indent=4))
+
+    print(f"Processing complete. Enhanced content and metadata saved to '{module_dir}'.")
+
+def main(args=None):
+    """
+    Entry point for the script, allowing command-line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Generate enhanced LaTeX content.")
+    parser.add_argument("--module_name", help="Name of the module to process.")
+    parser.add_argument("--vector_table_name", default="demo_load_docs_to_llamaindex", help="Vector table name.")
+    cli_args = parser.parse_args(args)
+
+    # Override environment variables with CLI arguments if provided
+    module_name = cli_args.module_name or os.getenv("MODULE_NAME")
+
+    if not module_name:
+        logger.error("Module name and database name must be specified via CLI or environment variables.")
+        sys.exit(1)
 
-    print(f"Processing complete. Enhanced content and metadata saved to 'assistant_latex/{course_name}/{module_name}'.")
+    execute(module_name, cli_args.vector_table_name)
 
 if __name__ == "__main__":
+    # Load environment variables
+    load_dotenv()
+
     # # # Hardcoded module_name for debugging
     # DEBUG_MODULE_NAME = "Topic 1 Introduction to computer security and malware"
 
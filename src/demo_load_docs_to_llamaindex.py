@@ -2,7 +2,6 @@ import argparse
 import logging
 import os
 import sys
-from sqlalchemy import URL
 from dotenv import load_dotenv
 from llama_index.vector_stores.tidbvector import TiDBVectorStore
 from llama_index.core import (
@@ -11,32 +10,20 @@ from llama_index.core import (
 )
 from llama_index.embeddings.openai import OpenAIEmbedding
 from demo_transcripts_to_docs import transcripts_to_docs
+from tidb_engine import ENGINE_ARGS, tidb_connection_url
 
 # Configure logging
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
-
-def main(transcript_path=None, metadata_file=None):
-    # Parse command-line arguments
-    parser = argparse.ArgumentParser(description="Load documents into TiDB VectorStore for LlamaIndex.")
-    parser.add_argument("--transcript_path", required=True, help="Path to the directory containing transcripts.")
-    parser.add_argument("--metadata_file", required=True, help="Path to the metadata file.")
-    parser.add_argument("--persist_dir", default="./storage", help="Directory to save index metadata.")
-
-    args = parser.parse_args()
-
-    # Allow overriding with function arguments for debugging
-    transcript_path = transcript_path or args.transcript_path
-    metadata_file = metadata_file or args.metadata_file
-
+def execute(transcript_path, metadata_file, persist_dir="./storage"):
+    """
+    Load transcripts and metadata into the TiDB vector store.
+    """
     # Load settings from .env
     tidb_username = os.getenv("TIDB_USERNAME")
     tidb_password = os.getenv("TIDB_PASSWORD")
     tidb_host = os.getenv("TIDB_HOST")
-    tidb_port = int(os.getenv("TIDB_PORT", 4000))  # Default port is 4000
     tidb_db_name = os.getenv("TIDB_DB_NAME")
     vector_table_name = os.getenv("VECTOR_TABLE_NAME", "demo_load_docs_to_llamaindex")  # Default table name
 
@@ -45,29 +32,20 @@ def main(transcript_path=None, metadata_file=None):
         sys.exit(1)
 
     # Load documents
-    documents = transcripts_to_docs(args.transcript_path, args.metadata_file)
+    documents = transcripts_to_docs(transcript_path, metadata_file)
 
-    # Define dimensions for embeddings (e.g., OpenAI ada embeddings: 1536)
-    embedding_model = OpenAIEmbedding(model="text-embedding-ada-002")
+    # Define dimensions for embeddings (e.g., OpenAI ada embeddings: 1536).
+    # Embed in batches of 100 texts per request instead of the default 10.
+    embedding_model = OpenAIEmbedding(model="text-embedding-ada-002", embed_batch_size=100)
     embedding_dimension = 1536
 
-    # TiDB connection URL
-    tidb_connection_url = URL(
-        "mysql+pymysql",
-        username=tidb_username,
-        password=tidb_password,
-        host=tidb_host,
-        port=tidb_port,
-        database=tidb_db_name,
-        query={"ssl_verify_cert": True, "ssl_verify_identity": True},
-    )
-
-    # Initialize TiDB vector store
+    # Initialize TiDB vector store with the pipeline's shared pool settings
     vector_store = TiDBVectorStore(
-        connection_string=tidb_connection_url,
+        connection_string=tidb_connection_url(),
         table_name=vector_table_name,
         distance_strategy="cosine",
         vector_dimension=embedding_dimension,
+        engine_args=ENGINE_ARGS,
         drop_existing_table=False,
     )
 
@@ -78,20 +56,35 @@ def main(transcript_path=None, metadata_file=None):
     index = VectorStoreIndex.from_documents(
         documents=documents,
         storage_context=storage_context,
-        embedding=embedding_model,
+        embed_model=embedding_model,
     )
 
     # Persist index to disk
-    storage_context.persist(persist_dir=args.persist_dir)
-    logger.info("Index saved to disk at %s.", args.persist_dir)
+    storage_context.persist(persist_dir=persist_dir)
+    logger.info("Index saved to disk at %s.", persist_dir)
+
+def main():
+    """
+    Entry point for the script, allowing command-line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Load documents into TiDB VectorStore for LlamaIndex.")
+    parser.add_argument("--transcript_path", required=True, help="Path to the directory containing transcripts.")
+    parser.add_argument("--metadata_file", required=True, help="Path to the metadata file.")
+    parser.add_argument("--persist_dir", default="./storage", help="Directory to save index metadata.")
+    args = parser.parse_args()
+
+    execute(args.transcript_path, args.metadata_file, args.persist_dir)
 
 if __name__ == "__main__":
+    # Load environment variables
+    load_dotenv()
+
     # # Mock entry point for debugging
     # DEBUG_TRANSCRIPT_PATH = "test_data/02@topic-1-malware-analysis"
     # DEBUG_METADATA_FILE = "../course-crawler/crawled_metadata/dl_coursera/uol-cm2025-computer-security.json"
 
     # # Uncomment the line below for debugging
-    # main(transcript_path=DEBUG_TRANSCRIPT_PATH, metadata_file=DEBUG_METADATA_FILE)
+    # execute(DEBUG_TRANSCRIPT_PATH, DEBUG_METADATA_FILE)
 
     # Uncomment the line below for production
     main()
\ No newline at end of file
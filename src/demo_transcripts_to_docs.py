@@ -6,12 +6,6 @@ from pathlib import Path
 from llama_index.core import Document
 from collections import defaultdict
 
-from dotenv import load_dotenv
-load_dotenv()  # This will load the variables from the .env file
-
-TRANSCRIPT_PATH = os.environ['TRANSCRIPT_PATH']
-METADATA_FILE = os.environ['METADATA_FILE']
-
 def load_metadata(metadata_file: str) -> dict:
     """Load metadata from a JSON file."""
     try:
@@ -39,6 +33,11 @@ def create_documents_with_metadata(metadata: dict, transcript_files: defaultdict
         """Extract the parent directory path."""
         return os.path.dirname(file_path)
 
+    # Resolve each transcript's parent directory once instead of per content entry
+    transcript_dirs = [(get_parent_dir(txt_file), txt_file) for txt_file in transcript_files["transcript"]]
+    if not transcript_dirs:
+        return documents
+
     for module in metadata.get("modules", []):
         module_name = module["module_name"]
         module_slug = module["module_slug"]
@@ -57,8 +56,8 @@ def create_documents_with_metadata(metadata: dict, transcript_files: defaultdict
                         srt_base_name = os.path.splitext(os.path.basename(srt_parent_dir))[0]
 
                         matching_txt_files = [
-                            txt_file for txt_file in transcript_files["transcript"]
-                            if get_parent_dir(txt_file).endswith(srt_base_name)
+                            txt_file for txt_dir, txt_file in transcript_dirs
+                            if txt_dir.endswith(srt_base_name)
                         ]
 
                         for txt_file in matching_txt_files:
@@ -96,5 +95,10 @@ def transcripts_to_docs(transcript_path: str, metadata_file: str):
     return documents
 
 # if __name__ == "__main__":
+#     from dotenv import load_dotenv
+#     load_dotenv()  # This will load the variables from the .env file
+#
 #     # Define paths to be used (can be configured or passed as arguments)
+#     TRANSCRIPT_PATH = os.environ['TRANSCRIPT_PATH']
+#     METADATA_FILE = os.environ['METADATA_FILE']
 #     documents = transcripts_to_docs(TRANSCRIPT_PATH, METADATA_FILE)
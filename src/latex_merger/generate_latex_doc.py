@@ -1,11 +1,21 @@
 import argparse
 import os
+import re
 import json
+from concurrent.futures import ThreadPoolExecutor
+
+# Placeholders in start.txt, substituted in a single scan
+PLACEHOLDER_PATTERN = re.compile(r'TEMPLATE_(?:COURSE_NAME|MODULE_NAME|LESSON_CODE)')
 
 # Utility function to sort sections/subsections by their order
 def sort_by_order(item):
     return item['order']
 
+# Utility function to read the raw bytes of a section file
+def read_section(section):
+    with open(section['path'], 'rb') as file:
+        return file.read()
+
 def execute(course, module, module_name):
     """
     Main function to generate a LaTeX document for a given module.
@@ -18,8 +28,8 @@ def execute(course, module, module_name):
     # Sort the sections and subsections by their order
     sorted_sections = sorted(metadata['sections'], key=sort_by_order)
 
-    # Read the start text
-    with open(os.path.join('src/latex_merger', 'start.txt'), 'r') as file:
+    # Read the start text; it is UTF-8 like the section files copied after it
+    with open(os.path.join('src/latex_merger', 'start.txt'), 'r', encoding='utf-8') as file:
         start_text = file.read()
 
     # Replace placeholders in the start text
@@ -28,23 +38,7 @@ def execute(course, module, module_name):
         'TEMPLATE_MODULE_NAME': module_name,
         'TEMPLATE_LESSON_CODE': module
     }
-    for key, value in replace_dict.items():
-        start_text = start_text.replace(key, value)
-
-    # Initialize the LaTeX content with the start text
-    latex_content = start_text + '\n\n'
-
-    # Iterate through the sorted sections and append their content
-    for section in sorted_sections:
-        print(f"Processing {section['type']}: {section['title']}")
-
-        with open(section['path'], 'r') as file:
-            content = file.read()
-
-        latex_content += content + '\n\n'
-
-    # Add the end document tag
-    latex_content += '\\end{document}\n'
+    start_text = PLACEHOLDER_PATTERN.sub(lambda m: replace_dict[m.group(0)], start_text)
 
     # Define the output path
     save_path = os.path.join('../tmp_latex_docs', course, 'Lecture Notes', module)
@@ -58,11 +52,33 @@ def execute(course, module, module_name):
             print("Operation cancelled.")
             return
 
-    # Create necessary directories and save the concatenated LaTeX content
+    # Create necessary directories
     os.makedirs(os.path.join(save_path, designer_folder), exist_ok=True)
 
-    with open(output_filepath, 'w') as file:
-        file.write(latex_content)
+    # Stream the start text, each section and the end tag to a temporary file, then move it
+    # into place so a failed read never leaves a truncated document behind.
+    # Section files are copied verbatim, so they are never decoded and re-encoded.
+    tmp_filepath = output_filepath + '.tmp'
+    try:
+        with open(tmp_filepath, 'wb', buffering=1 << 20) as file:
+            file.write((start_text + '\n\n').encode('utf-8'))
+
+            # Read the section files concurrently; map preserves the sorted order
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                for section, content in zip(sorted_sections, executor.map(read_section, sorted_sections)):
+                    print(f"Processing {section['type']}: {section['title']}")
+                    file.write(content)
+                    file.write(b'\n\n')
+
+            # Add the end document tag
+            file.write(b'\\end{document}\n')
+
+        os.replace(tmp_filepath, output_filepath)
+    except BaseException:
+        # Drop the partial temporary file; the previous document (if any) stays untouched
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        raise
 
     print(f"LaTeX document successfully generated at: {output_filepath}")
 
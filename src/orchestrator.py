@@ -1,43 +1,36 @@
 import os
-import subprocess
+import traceback
 from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
-
 # Define pipeline functions
 def run_load_docs(transcript_path, metadata_file):
     """
     Run the document loading pipeline.
     """
+    # Imported here so runs that skip this step don't pay for llama_index
+    from demo_load_docs_to_llamaindex import execute as load_docs
+
     print("Running: demo_load_docs_to_llamaindex.py")
-    subprocess.run([
-        "python", "src/demo_load_docs_to_llamaindex.py",
-        "--transcript_path", transcript_path,
-        "--metadata_file", metadata_file
-    ], check=True)
+    load_docs(transcript_path, metadata_file)
 
 def run_call_llamaindex(module_name):
     """
     Run the LlamaIndex processing pipeline.
     """
+    # Imported here so runs that skip this step don't pay for llama_index
+    from demo_call_llamaindex import execute as call_llamaindex
+
     print("Running: demo_call_llamaindex.py")
-    subprocess.run([
-        "python", "src/demo_call_llamaindex.py",
-        "--module_name", module_name
-    ], check=True)
+    call_llamaindex(module_name)
 
 def run_generate_latex(course, module, module_name):
     """
     Run the LaTeX generation pipeline.
     """
+    from latex_merger.generate_latex_doc import execute as generate_latex
+
     print("Running: generate_latex_doc.py")
-    subprocess.run([
-        "python", "src/latex_merger/generate_latex_doc.py",
-        "--course", course,
-        "--module", module,
-        "--module_name", module_name
-    ], check=True)
+    generate_latex(course, module, module_name)
 
 def orchestrate_pipeline(run_load=True, run_call=True, run_generate=True):
     """
@@ -91,10 +84,18 @@ def orchestrate_pipeline(run_load=True, run_call=True, run_generate=True):
             run_call_llamaindex(module_name)
         if run_generate:
             run_generate_latex(course, module, module_name)
-    except subprocess.CalledProcessError as e:
-        print(f"Pipeline step failed: {e}")
+    except SystemExit as e:
+        # Stages run in-process, so their sys.exit() calls surface here as SystemExit
+        print(f"Pipeline step exited with status {e.code}")
+    except Exception:
+        # Print the full traceback so failures inside a stage can still be located
+        print("Pipeline step failed:")
+        traceback.print_exc()
 
 if __name__ == "__main__":
+    # Load environment variables once for every stage; library callers load their own
+    load_dotenv()
+
     # Example DAG execution: All steps
     orchestrate_pipeline(run_load=False, run_call=True, run_generate=True)
 
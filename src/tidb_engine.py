@@ -0,0 +1,33 @@
+import os
+from functools import lru_cache
+from sqlalchemy import URL, create_engine
+
+# Connection pool settings shared by every TiDB engine in the pipeline
+ENGINE_ARGS = {
+    "pool_size": 10,
+    "max_overflow": 20,
+    "pool_timeout": 30,
+    "pool_recycle": 1800,
+    "pool_pre_ping": True,
+}
+
+def tidb_connection_url():
+    """
+    Build the TiDB connection URL from the environment.
+    """
+    return URL(
+        "mysql+pymysql",
+        username=os.getenv("TIDB_USERNAME"),
+        password=os.getenv("TIDB_PASSWORD"),
+        host=os.getenv("TIDB_HOST"),
+        port=int(os.getenv("TIDB_PORT", 4000)),
+        database=os.getenv("TIDB_DB_NAME"),
+        query={"ssl_verify_cert": True, "ssl_verify_identity": True},
+    )
+
+@lru_cache(maxsize=1)
+def get_engine():
+    """
+    Create the pooled SQLAlchemy engine on first use and share it across pipeline stages.
+    """
+    return create_engine(tidb_connection_url(), **ENGINE_ARGS)